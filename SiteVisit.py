@@ -9,20 +9,68 @@ import sys
 import subprocess
 import shutil
 import re
-import io
+import csv
+import json
+import logging
 import datetime
+import queue
 import comtypes.client
 import fitz
-import qrcode
+import segno
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor,
+                                as_completed)
+from functools import lru_cache
 from operator import itemgetter
+from typing import NamedTuple
+
+
+_log = logging.getLogger(__name__)
+
+# Runs of underscores, with any surrounding spaces, between name fields
+_SEPARATOR_RE = re.compile(r"\s*\_+\s*")
+
+# File types that can only be a poster or only be a paper
+_POSTER_EXTS = frozenset({".ppt", ".pptx"})
+_PAPER_EXTS = frozenset({".doc", ".docx"})
+
+# Manifest of the conversion cache,
+# {office file path relative to the output folder: [size, mtime in ns]}
+_CACHE_MANIFEST = ".sitevisit_cache.json"
+
+# Poster category and research area found in the submission folder path
+_FOLDER_RE = re.compile(r"(?P<category>Core|Non-core|Associated)|"
+                        r"(?P<area>Hardware\sTestbed|Actuation\sand\sHVDC|"
+                        r"Large\sScale\sTestbed|Other\sCategories|"
+                        r"Power\sConverter\sDesign\sand\sControl|"
+                        r"Power\sElectronics\sDevices\sand\sComponents|"
+                        r"Power\sSystem\sControl|Power\sSystem\sEstimation|"
+                        r"Power\sSystem\sModeling|Power\sSystem\sMonitoring)",
+                        flags=re.IGNORECASE)
+
+
+class Submission(NamedTuple):
+    """A paper or poster file found in the submission folder"""
+    file: str
+    fname: str
+    bname: str
+    revs: int
+    last: str
+    first: str
+    univ: str
+    prof: str
+    indx: str
+    ext: str
+    category: str
+    area: str
+    mtime: float
 
 
 def decode(filename):
     """Decode the filename with the expected filename convention"""
     # Replace multiple underscores and space with a single one and split
-    fields = re.sub(r"\s*\_+\s*", "_", filename).split('_')
+    fields = _SEPARATOR_RE.sub("_", filename).split('_')
 
-    if len(fields) not in range(4, 7):
+    if not 4 <= len(fields) <= 6:
         raise ValueError(f"{filename} uses wrong convention")
 
     last, first, univ, prof = fields[0], fields[1], fields[2], fields[3]
@@ -37,300 +85,567 @@ def decode(filename):
 
 def categorize(filepath):
     """Find the poster/paper category and area"""
-    c = re.compile("Core|Non-core|Associated", flags=re.IGNORECASE)
-    a = re.compile(r"Hardware\sTestbed|Actuation\sand\sHVDC|"
-                   r"Large\sScale\sTestbed|Other\sCategories|"
-                   r"Power\sConverter\sDesign\sand\sControl|"
-                   r"Power\sElectronics\sDevices\sand\sComponents|"
-                   r"Power\sSystem\sControl|Power\sSystem\sEstimation|"
-                   r"Power\sSystem\sModeling|Power\sSystem\sMonitoring",
-                   flags=re.IGNORECASE)
-
-    if c.search(filepath):
-        category = c.search(filepath).group(0)
-    else:
-        category = None
+    # Single scan of filepath, keeping the first match of each kind
+    category = area = None
+    for m in _FOLDER_RE.finditer(filepath):
+        if m.lastgroup == "category":
+            category = category or m.group(0)
+        else:
+            area = area or m.group(0)
 
-    if a.search(filepath):
-        area = a.search(filepath).group(0)
-    else:
+        if category and area:
+            break
+
+    if not area:
         raise ValueError(f"Filepath {filepath} does not contain research area")
 
     return category, area
 
 
-def getAllFiles(dir):
-    """Get a list of all files in dir including sub-dir"""
-    allFiles = []
-    for root, _, files in os.walk(dir):
-        for f in files:
-            allFiles.append(os.path.join(root, f))
-    
-    return allFiles
-
-def batch2pdf(srcDir, verbose):
-    """Autocatically replace ppt/doc with pdf in srcDir"""
-    powerpoint = comtypes.client.CreateObject("Powerpoint.Application")
-    word = comtypes.client.CreateObject("Word.Application")
-
-    allFiles = getAllFiles(srcDir)
-
-    for f in allFiles:
-        path = os.path.dirname(f)
-        name, ext = os.path.splitext(os.path.basename(f))
-
-        if ext.lower() == ".pdf":
-            pass
-        elif ext.lower() == ".csv":
-            # Likely the list of papers and posters so don't do anything
+def getTree(dir):
+    """Map every directory under dir (itself included) to its file entries
+
+    The os.DirEntry objects cache the stat results from the directory
+    listing, so no further syscalls are needed to read their mtime.
+    Directories come in the same order as os.walk, and like os.walk those
+    that cannot be read are skipped"""
+    tree = {}
+    stack = [dir]
+    while stack:
+        path = stack.pop()
+        files = []
+        subdirs = []
+        try:
+            with os.scandir(path) as it:
+                for e in it:
+                    if not e.is_dir():
+                        files.append(e)
+                    elif not e.is_symlink():
+                        # Like os.walk, don't descend into linked directories
+                        subdirs.append(e.path)
+        except OSError:
+            continue
+
+        tree[path] = files
+        # Reversed so the stack hands them out in listing order
+        stack.extend(reversed(subdirs))
+
+    return tree
+
+
+def fastCopy(src, dst):
+    """Copy the contents of src to dst
+
+    Where the OS supports it the data is copied in the kernel, which on
+    copy-on-write filesystems only shares the blocks"""
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+                size = os.fstat(fsrc.fileno()).st_size
+                copied = 0
+                while copied < size:
+                    n = os.copy_file_range(fsrc.fileno(), fdst.fileno(),
+                                           1 << 30)
+                    if not n:
+                        break
+                    copied += n
+            # Some filesystems report nothing copied rather than failing
+            if copied == size:
+                return
+        except OSError:
+            # Not supported between these filesystems, copy normally
             pass
-        elif ext.lower() in [".ppt", ".pptx", ".doc", ".docx"]:
-            if verbose:
-                print(f"Replacing {name} with pdf...", end=" ")
 
+    shutil.copyfile(src, dst)
+
+
+def ppt2pdf(powerpoint, f, pdf):
+    """Save Powerpoint file f as pdf"""
+    # Read-only (msoTrue) so Powerpoint never prompts about the file
+    deck = powerpoint.Presentations.Open(f, ReadOnly=-1)
+    try:
+        # Powerpoint formatType code 32 for pdf
+        deck.SaveAs(pdf, 32)
+    finally:
+        deck.Close()
+
+
+def doc2pdf(word, f, pdf):
+    """Save Word file f as pdf"""
+    doc = word.Documents.open(f, ConfirmConversions=False, ReadOnly=True,
+                              AddToRecentFiles=False)
+    try:
+        # Word formatType code 17 for pdf
+        doc.SaveAs(pdf, 17)
+    finally:
+        # wdDoNotSaveChanges, the file is only read
+        doc.Close(SaveChanges=0)
+
+
+def startOffice(progId):
+    """Start an Office application set up for unattended conversion"""
+    app = comtypes.client.CreateObject(progId)
+    # msoAutomationSecurityForceDisable, no macros run on open
+    app.AutomationSecurity = 3
+    if progId == "Word.Application":
+        # wdAlertsNone, and no redrawing of documents nobody looks at
+        app.DisplayAlerts = 0
+        app.ScreenUpdating = False
+    else:
+        # ppAlertsNone
+        app.DisplayAlerts = 1
+
+    return app
+
+
+# Office application and converter for each file type turned into pdf
+_CONVERTERS = {".ppt": ("Powerpoint.Application", ppt2pdf),
+               ".pptx": ("Powerpoint.Application", ppt2pdf),
+               ".doc": ("Word.Application", doc2pdf),
+               ".docx": ("Word.Application", doc2pdf)}
+
+
+def convertShard(files, done):
+    """Convert ppt/doc files to pdf with Office instances of this thread
+
+    files holds (index, file) pairs. (index, pdf file) is put on the done
+    queue as each file is converted, with None as pdf file if conversion
+    failed, and (None, None) once the whole shard is finished"""
+    try:
+        comtypes.CoInitialize()
+        # Applications are started on first use. Each thread gets its own
+        # Word, while Powerpoint is a single instance shared by every thread.
+        # It rejects calls from other threads while it exports a pdf, so
+        # batch2pdf gives all Powerpoint files to a single thread
+        apps = {}
+
+        try:
+            for i, f in files:
+                path = os.path.dirname(f)
+                name, ext = os.path.splitext(os.path.basename(f))
+                pdf = os.path.join(path, name + ".pdf")
+
+                progId, convert = _CONVERTERS[ext.lower()]
+                if progId not in apps:
+                    apps[progId] = startOffice(progId)
+
+                try:
+                    convert(apps[progId], f, pdf)
+                except comtypes.COMError:
+                    print(f"ERROR: Converting {f} failed")
+                    done.put((i, None))
+                    continue
+
+                _log.info("Replaced %s with pdf", name)
+
+                os.remove(f)
+                done.put((i, pdf))
+        finally:
+            if "Word.Application" in apps:
+                try:
+                    apps["Word.Application"].Quit()
+                except comtypes.COMError:
+                    # Word has already crashed or gone away
+                    pass
+            # Release the COM objects before leaving the apartment
+            apps.clear()
             try:
-                if ext.lower() in [".ppt", ".pptx"]:
-                    deck = powerpoint.Presentations.Open(f)
-                    # Powerpoint formatType code 32 for pdf
-                    deck.SaveAs(os.path.join(path, name + ".pdf"), 32)
-                    deck.Close()
-                else:
-                    doc = word.Documents.open(os.path.join(srcDir, f))
-                    # Word formatType code 17 for pdf
-                    doc.SaveAs(os.path.join(path, name + ".pdf"), 17)
-                    doc.Close()
+                comtypes.CoUninitialize()
             except comtypes.COMError:
-                print(f"\nERROR: Converting {f} failed")
-                print("Please check if the file has Visio drawings")
-                print("Also check PDF export settings (PDF/A must be off)")
-                print("Also maximize the Powerpoint/Word application")
-                quit()
-
-            if verbose:
-                print(f"Success")
-
-            os.remove(f)
+                pass
+    finally:
+        # Always report the shard as finished, or batch2pdf waits forever
+        done.put((None, None))
+
+
+def loadCache(cacheDir):
+    """Read the manifest of files converted by previous runs"""
+    try:
+        with open(os.path.join(cacheDir, _CACHE_MANIFEST), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def saveCache(cacheDir, manifest):
+    """Write the manifest of converted files"""
+    tmp = os.path.join(cacheDir, _CACHE_MANIFEST + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(cacheDir, _CACHE_MANIFEST))
+
+
+def batch2pdf(allFiles, workers=None, cacheDir=None, dstDir=None):
+    """Autocatically replace ppt/doc in allFiles with pdf
+
+    Yields the index in allFiles and the resulting pdf file of each file as
+    soon as it is ready, so later stages can start on it right away. With a
+    cacheDir, files unchanged since a previous run reuse the pdf converted
+    back then instead of going through Office again. Cached files are named
+    by their path relative to dstDir, the output folder holding allFiles.
+    workers is the number of threads converting Word files, by default the
+    CPU count up to four. Powerpoint files always use a single thread"""
+    # Indices of the files already in pdf and of those needing conversion
+    ready = []
+    toConvert = []
+    for i, f in enumerate(allFiles):
+        ext = os.path.splitext(f)[1].lower()
+        if ext in _CONVERTERS:
+            toConvert.append(i)
+        elif ext == ".pdf":
+            ready.append(i)
         else:
-            raise ValueError(f"Unexpected filetype .{ext} in {path}")
+            raise ValueError(f"Unexpected filetype {ext} for {f}")
+
+    for i in ready:
+        yield i, allFiles[i]
+
+    # Office files keep the size and mtime of the submission, so these
+    # identify a file that was already converted by a previous run. A paper
+    # and its poster may share a file name, but not a path in the output
+    manifest = {}
+    keys = {}
+    stamps = {}
+    if cacheDir is not None:
+        manifest = loadCache(cacheDir)
+        missed = []
+        for i in toConvert:
+            f = allFiles[i]
+            keys[i] = os.path.relpath(f, dstDir).replace(os.sep, "/")
+            st = os.stat(f)
+            stamps[i] = [st.st_size, st.st_mtime_ns]
+            cached = os.path.join(cacheDir, keys[i] + ".pdf")
+            if manifest.get(keys[i]) != stamps[i] or \
+               not os.path.isfile(cached):
+                missed.append(i)
+                continue
+
+            # Copy rather than link, posters are modified by QR insertion
+            pdf = os.path.splitext(f)[0] + ".pdf"
+            fastCopy(cached, pdf)
+            os.remove(f)
+            _log.info("Reused cached pdf for %s", keys[i])
+            yield i, pdf
+        toConvert = missed
+
+    # Spread the Word files over several threads, each starting its own
+    # Word, so keep their number modest. Powerpoint is one shared instance
+    # that cannot take calls from several threads at once, so all
+    # Powerpoint files go through one more thread of their own
+    if workers is None:
+        workers = min(os.cpu_count() or 1, 4)
+    ppts = []
+    docs = []
+    for i in toConvert:
+        progId = _CONVERTERS[os.path.splitext(allFiles[i])[1].lower()][0]
+        (ppts if progId == "Powerpoint.Application" else docs).append(i)
+    shards = [ppts] + [docs[k::workers] for k in range(workers)]
+    shards = [s for s in shards if s]
+    failed = []
+    done = queue.Queue()
+    with ThreadPoolExecutor(max_workers=max(len(shards), 1)) as ex:
+        futures = [ex.submit(convertShard, [(i, allFiles[i]) for i in s],
+                             done) for s in shards]
+
+        finished = 0
+        while finished < len(futures):
+            i, pdf = done.get()
+            if i is None:
+                finished += 1
+            elif pdf is None:
+                failed.append(allFiles[i])
+            else:
+                if cacheDir is not None:
+                    cached = os.path.join(cacheDir, keys[i] + ".pdf")
+                    os.makedirs(os.path.dirname(cached), exist_ok=True)
+                    fastCopy(pdf, cached)
+                    manifest[keys[i]] = stamps[i]
+                yield i, pdf
+
+        # Raise any error that stopped a shard early
+        for future in futures:
+            future.result()
+
+    if cacheDir is not None:
+        saveCache(cacheDir, manifest)
+
+    if failed:
+        print("Please check if the file has Visio drawings")
+        print("Also check PDF export settings (PDF/A must be off)")
+        print("Also maximize the Powerpoint/Word application")
+        quit()
 
 
 def scan(srcDir):
     """Process papers and posters from root folder"""
-    allFiles = getAllFiles(srcDir)
+    tree = getTree(srcDir)
 
     # Determine if a file is paper or poster and record in dictionary
     posters = []
     papers = []
-    for f in allFiles:
-        base = os.path.basename(f)
-        path = os.path.dirname(f)
-        name, ext = os.path.splitext(base)
-
-        isPoster = "Poster" in path or ext.lower() in [".ppt", ".pptx"]
-        isPaper = "Paper" in path or ext.lower() in [".doc", ".docx"]
-
-        if (not (isPoster or isPaper)) and ext.lower() == ".pdf":
-            # Determine by other files in the same folder
-            for a in os.listdir(path):
-                isPaper |= ".doc" in a.lower()
-                isPoster |= ".ppt" in a.lower()
-
-        if (isPoster and isPaper) and (not (isPoster or isPaper)):
-            raise ValueError(f"Ambiguous type {f}: paper or poster?")
+    for path, files in tree.items():
+        if not files:
+            continue
 
+        # Everything derived from the folder is worked out once per folder
+        inPosters = "Poster" in path
+        inPapers = "Paper" in path
         category, area = categorize(path)
-        last, first, univ, prof, indx, revs = decode(name)
-        # Formatted name
-        fname = '_'.join([last, first, univ, prof, indx, revs])
-        # Base name without revision number
-        bname = '_'.join([last, first, univ, prof, indx])
-        revs = int(revs[1:])
-        # Modified time
-        mtime = os.path.getmtime(f)
-        d = {"file": f, "fname": fname, "bname": bname, "revs": revs,
-             "last": last, "first": first, "univ": univ, "prof": prof,
-             "indx": indx, "ext": ext, "category": category, "area": area, 
-             "mtime": mtime}
-
-        if isPoster:
-            posters.append(d)
-        else:
-            papers.append(d)
+        # Other files in the same folder tell what a pdf there is
+        hasDoc = any(".doc" in e.name.lower() for e in files)
+        hasPpt = any(".ppt" in e.name.lower() for e in files)
+
+        for e in files:
+            f = e.path
+            name, ext = os.path.splitext(e.name)
+            lowerExt = ext.lower()
+
+            isPoster = inPosters or lowerExt in _POSTER_EXTS
+            isPaper = inPapers or lowerExt in _PAPER_EXTS
+
+            if (not (isPoster or isPaper)) and lowerExt == ".pdf":
+                isPaper = hasDoc
+                isPoster = hasPpt
+
+            if (isPoster and isPaper) and (not (isPoster or isPaper)):
+                raise ValueError(f"Ambiguous type {f}: paper or poster?")
+
+            last, first, univ, prof, indx, revs = decode(name)
+            # Formatted name
+            fname = '_'.join([last, first, univ, prof, indx, revs])
+            # Base name without revision number
+            bname = '_'.join([last, first, univ, prof, indx])
+            d = Submission(f, fname, bname, int(revs[1:]), last, first, univ,
+                           prof, indx, ext, category, area, e.stat().st_mtime)
+
+            if isPoster:
+                posters.append(d)
+            else:
+                papers.append(d)
 
     return papers, posters
 
 
 def removeOldRevisions(fileList):
     """Find and delete older revisions"""
-    baseNames = [f["bname"] for f in fileList]
-    revisions = [f["revs"] for f in fileList]
-
-    # Sorted indices with baseNames to aggeregate same paper/poster
-    sIndx = sorted(range(len(baseNames)), key=baseNames.__getitem__)
-    sNames = [baseNames[i] for i in sIndx]
-    sRevs = [revisions[i] for i in sIndx]
-
-    prevName = ''
-    lastRev = -1
-    indxToDel = []
-    for i, n in enumerate(sNames):
-        if n != prevName:
-            prevName = n
-            lastRev = sRevs[i]
-        elif sRevs[i] > lastRev:
-            print(f"Remove ver. {lastRev} < latest {sRevs[i]} for {n}")
-
-            indxToDel.append(sIndx[i-1])
-            lastRev = sRevs[i]
-        elif sRevs[i] < lastRev:
-            print(f"Remove ver. {sRevs[i]} < latest {lastRev} for {n}")
-
-            indxToDel.append(sIndx[i])
-
-    return [fileList[i] for i in set(sIndx) - set(indxToDel)]
+    # Index and revision of the latest submission for each base name
+    latest = {}
+    for i, f in enumerate(fileList):
+        n, rev = f.bname, f.revs
+        cur = latest.get(n)
+        if cur is None:
+            latest[n] = (i, rev)
+        elif rev > cur[1]:
+            print(f"Remove ver. {cur[1]} < latest {rev} for {n}")
+            latest[n] = (i, rev)
+        elif rev < cur[1]:
+            print(f"Remove ver. {rev} < latest {cur[1]} for {n}")
+
+    keep = {i for i, _ in latest.values()}
+    return [f for i, f in enumerate(fileList) if i in keep]
 
 
 def checkDuplicate(fileList):
     """Find duplicate submissions in fileList"""
     duplicate = False
 
-    uniqs = []
+    seen = set()
     for f in fileList:
-        if f["fname"] not in uniqs:
-            uniqs.append(f["fname"])
-        else:
+        if f.fname in seen:
             duplicate = True
-            print(f"Duplicate found: {f['file']}")
+            print(f"Duplicate found: {f.file}")
+        else:
+            seen.add(f.fname)
 
     if duplicate:
         print("Duplicate submission file found. Stopping...")
         quit()
 
 
-def copyFormated(papers, posters, dstDir, verbose):
-    """Copy files in papers and posters to dstDir as structured"""
+def placeFile(src, dst, link, mtime):
+    """Hardlink src as dst if link is set and possible, copy it otherwise
+
+    Copies get the modified time mtime already read from src"""
+    if link:
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            # Different volume or no hardlink support, copy instead
+            pass
+
+    fastCopy(src, dst)
+    os.utime(dst, (mtime, mtime))
+
+
+def copyFormated(papers, posters, dstDir):
+    """Copy files in papers and posters to dstDir as structured
+
+    Returns the lists of copied paper and poster files"""
+    # Create every destination folder once rather than once per file
+    subdirs = {os.path.join(dstDir, "Papers", p.area) for p in papers}
+    subdirs |= {os.path.join(dstDir, "Posters", p.category, p.area)
+                for p in posters}
+    for d in subdirs:
+        os.makedirs(d, exist_ok=True)
+
+    paperFiles = []
+    posterFiles = []
+    # dstDir is freshly created, so only files written here can collide.
+    # Names are compared case-folded where the filesystem ignores case
+    written = set()
     for p in papers:
         # No categories for papers
-        dstSubdir = os.path.join(dstDir, "Papers", p["area"])
-        os.makedirs(dstSubdir, exist_ok=True)
-        dstFile = os.path.join(dstSubdir, p["bname"] + p["ext"])
-        if os.path.isfile(dstFile):
+        dstSubdir = os.path.join(dstDir, "Papers", p.area)
+        dstFile = os.path.join(dstSubdir, p.bname + p.ext)
+        if os.path.normcase(dstFile) in written:
             raise ValueError(f"File already exists: {dstFile}")
+        written.add(os.path.normcase(dstFile))
 
-        shutil.copy2(p["file"], dstFile)
+        # Papers are never modified, only converted to new pdf files
+        placeFile(p.file, dstFile, True, p.mtime)
+        paperFiles.append(dstFile)
 
-        if verbose:
-            print(f"Paper {p['fname']} copied to {dstSubdir}")
+        _log.info("Paper %s copied to %s", p.fname, dstSubdir)
 
     for p in posters:
-        dstSubdir = os.path.join(dstDir, "Posters", p["category"], p["area"])
-        os.makedirs(dstSubdir, exist_ok=True)
-        dstFile = os.path.join(dstSubdir, p["bname"] + p["ext"])
-        if os.path.isfile(dstFile):
+        dstSubdir = os.path.join(dstDir, "Posters", p.category, p.area)
+        dstFile = os.path.join(dstSubdir, p.bname + p.ext)
+        if os.path.normcase(dstFile) in written:
             raise ValueError(f"File already exists: {dstFile}")
+        written.add(os.path.normcase(dstFile))
+
+        # The QR code is written into poster pdfs in place, so those must be
+        # real copies or the submission itself would be changed
+        placeFile(p.file, dstFile, p.ext.lower() != ".pdf", p.mtime)
+        posterFiles.append(dstFile)
 
-        shutil.copy2(p["file"], dstFile)
+        _log.info("Poster %s copied to %s", p.fname, dstSubdir)
 
-        if verbose:
-            print(f"Poster {p['fname']} copied to {dstSubdir}")
+    return paperFiles, posterFiles
 
 
-def getPosterTitle(pdfFile, rect=[0, 0, 1728, 290]):
-    """Extract poster title from pdf"""
+def getPosterTitle(page, rect=[0, 0, 1728, 290]):
+    """Extract poster title from the first page of the poster pdf"""
     # [0, 0, 1728, 290] works for the poster template
-    doc = fitz.open(pdfFile)
-    words = doc[0].getTextWords()
-    title = [w for w in words if fitz.Rect(w[:4]) in fitz.Rect(rect)]
+    x0, y0, x1, y1 = rect
+    # Words are (x0, y0, x1, y1, word, ...), compare their boxes directly
+    # rather than building a Rect for each
+    title = [w for w in page.get_text("words")
+             if x0 <= w[0] and y0 <= w[1] and w[2] <= x1 and w[3] <= y1]
     title.sort(key=itemgetter(3, 0))
     return ' '.join(w[4] for w in title).strip().encode("utf-8", 'ignore')
 
 
-def saveList(papers, posters, dstDir):
-    """Write list of papers and posters to csv files in dstDir"""
+def saveList(papers, posters, dstDir, titles):
+    """Write list of papers and posters to csv files in dstDir
+
+    titles maps the index of each poster in posters to the title read while
+    inserting its QR code, posters missing from it get a blank title"""
     paperFile = os.path.join(dstDir, "Papers.csv")
-    with open(paperFile, "w", encoding="utf-8") as f:
-        f.write("File name, Area, Last name, First name, University, "
-                "Professor, Index, Revision, Last Modified, Title, Abstract\n")
-
-        for p in papers:
-            # Title and abstract needs mannual input
-            title = " "
-            abstract = " "
-            f.write(f"{p['fname']}, "
-                    f"{p['area']}, "
-                    f"{p['last']}, "
-                    f"{p['first']}, "
-                    f"{p['univ']}, "
-                    f"{p['prof']}, "
-                    f"{p['indx']}, "
-                    f"{p['revs']}, "
-                    f"{p['mtime']}, "
-                    f"{title}, "
-                    f"{abstract}\n")
+    # Large buffer so each list goes out in as few writes as possible
+    with open(paperFile, "w", encoding="utf-8", newline="",
+              buffering=1 << 20) as f:
+        w = csv.writer(f)
+        w.writerow(["File name", "Area", "Last name", "First name",
+                    "University", "Professor", "Index", "Revision",
+                    "Last Modified", "Title", "Abstract"])
+        # Title and abstract needs mannual input
+        w.writerows([p.fname, p.area, p.last, p.first, p.univ, p.prof,
+                     p.indx, p.revs, p.mtime, " ", " "] for p in papers)
+
+    rows = [[p.fname, p.category, p.area, p.last, p.first, p.univ, p.prof,
+             p.indx, p.revs, p.mtime, titles.get(k, " ")]
+            for k, p in enumerate(posters)]
 
     posterFile = os.path.join(dstDir, "Posters.csv")
-    with open(posterFile, "w", encoding="utf-8") as f:
-        f.write("File name, Category, Area, Last name, First name, "
-                "University, Professor, Index, Revision, "
-                "Last Modified, Title\n")
-
-        for p in posters:
-            title = ""
-            try:
-                pdfFile = os.path.abspath(os.path.join(dstDir, 
-                                                       "Posters", 
-                                                       p["category"], 
-                                                       p["area"], 
-                                                       p["bname"] + ".pdf"))
-                title = getPosterTitle(pdfFile)
-            except:
-                title = " "
-
-            f.write(f"{p['fname']}, "
-                    f"{p['category']}, "
-                    f"{p['area']}, "
-                    f"{p['last']}, "
-                    f"{p['first']}, "
-                    f"{p['univ']}, "
-                    f"{p['prof']}, "
-                    f"{p['indx']}, "
-                    f"{p['revs']}, "
-                    f"{p['mtime']}, "
-                    f"{title}\n")
+    with open(posterFile, "w", encoding="utf-8", newline="",
+              buffering=1 << 20) as f:
+        w = csv.writer(f)
+        w.writerow(["File name", "Category", "Area", "Last name",
+                    "First name", "University", "Professor", "Index",
+                    "Revision", "Last Modified", "Title"])
+        w.writerows(rows)
+
+
+@lru_cache(maxsize=4096)
+def makeQRCode(link, width):
+    """Render the QR code to link as 8-bit grayscale samples
+
+    The code is at least width pixels wide, with the smallest whole number
+    of pixels per module. Returns the side length in pixels and the samples.
+    Rendered codes are cached by link and reused for repeated links"""
+    # Lowest error level for the smallest code, segno raises it as far as
+    # the resulting version allows
+    qr = segno.make_qr(link, error="l")
+    # Modules including the quiet zone, truthy if dark
+    matrix = [list(row) for row in qr.matrix_iter()]
+    box = max(1, -(-int(width) // len(matrix)))
+
+    # Each module becomes a box x box square, black (0) if dark
+    rows = []
+    for row in matrix:
+        line = b"".join(b"\x00" * box if dark else b"\xff" * box
+                        for dark in row)
+        rows.append(line * box)
+
+    return len(matrix) * box, b"".join(rows)
 
 
 def insertQRCode(srcPDF, link, location):
-    """Insert the QR code to link on pdfFile"""
-    buf = io.BytesIO()
-    qrcode.make(link).save(buf)
+    """Insert the QR code to link on srcPDF and return the poster title
+
+    The title is read from the same opened document, so each poster is
+    parsed only once"""
+    # One pixel per point of the target rectangle is enough for print
+    size, samples = makeQRCode(link, location[2] - location[0])
+    pixmap = fitz.Pixmap(fitz.csGRAY, size, size, samples, 0)
 
     doc = fitz.open(srcPDF)
-    doc[0].insertImage(fitz.Rect(*location), stream=buf.getvalue())
+    try:
+        title = getPosterTitle(doc[0])
+    except Exception:
+        # A poster without readable text still gets its QR code
+        title = " "
+    doc[0].insert_image(fitz.Rect(*location), pixmap=pixmap)
+
+    if doc.can_save_incrementally():
+        # Only append the QR image and the updated objects to the file,
+        # keeping any encryption as is
+        doc.save(srcPDF, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+        doc.close()
+    else:
+        # Files repaired on opening must be written out in full. Use a
+        # temporary file per pdf as several posters are processed at once
+        tmp = srcPDF + ".tmp"
+        doc.save(tmp)
+        doc.close()
+        os.replace(tmp, srcPDF)
 
-    path = os.path.dirname(srcPDF)
-    tmp = os.path.join(path, "tmp.pdf")
-    doc.save(tmp)
-    doc.close()
-    os.replace(tmp, srcPDF)
+    return title
 
 
-def batchQRCode(srcDir, baseLink, location, verbose):
-    """Insert QR code to every pdf file in srcDir"""
-    allFiles = getAllFiles(srcDir)
+def batchQRCode(allFiles, baseLink, location):
+    """Insert QR code to every pdf file in allFiles
 
+    allFiles can be any iterable of (key, pdf file) pairs, each file is
+    handed to a worker as soon as it comes out of it. Returns the poster
+    title of each file by its key"""
     if baseLink[-1] != '/':
         baseLink += '/'
 
-    for f in allFiles:
-        if verbose:
-            print(f"Inserting QR code to {f}...", end=" ")
+    # QR rendering and pdf rewriting are CPU bound, use one process per core
+    with ProcessPoolExecutor() as ex:
+        futures = {ex.submit(insertQRCode, f, baseLink + os.path.basename(f),
+                             location): (k, f) for k, f in allFiles}
 
-        base = os.path.basename(f)
-        link = baseLink + base
-        insertQRCode(f, link, location)
+        titles = {}
+        for future in as_completed(futures):
+            k, f = futures[future]
+            titles[k] = future.result()
+            _log.info("Inserted QR code to %s", f)
 
-        if verbose:
-            print("Success")
+    return titles
 
 
 if __name__ == "__main__":
@@ -343,46 +658,42 @@ if __name__ == "__main__":
     timenow = datetime.datetime.now().strftime("%b %d %y %H%M%S")
     newDir = os.path.join(root, os.pardir, "NO UPLOAD Generated " + timenow)
     newDir = os.path.abspath(newDir)
+    # Pdf converted by previous runs, kept across the generated folders
+    cacheDir = os.path.join(root, os.pardir, "NO UPLOAD Conversion Cache")
+    cacheDir = os.path.abspath(cacheDir)
 
     verbose = True
+    # Progress messages are only formatted and written when verbose
+    logging.basicConfig(format="%(message)s",
+                        level=logging.INFO if verbose else logging.WARNING)
 
-    if verbose:
-        print(f"Scanning files in {root}...")
+    _log.info("Scanning files in %s...", root)
 
     papers, posters = scan(root)
 
-    if verbose:
-        print("Checking duplicates...")
+    _log.info("Checking duplicates...")
 
     checkDuplicate(papers)
     checkDuplicate(posters)
 
-    if verbose:
-        print("No duplicate found, removing old revisions...")
+    _log.info("No duplicate found, removing old revisions...")
 
     papers = removeOldRevisions(papers)
     posters = removeOldRevisions(posters)
 
-    if verbose:
-        print(f"Creating folder structure in {newDir}")
+    _log.info("Creating folder structure in %s", newDir)
 
     os.makedirs(os.path.join(newDir, "Papers"), exist_ok=True)
     os.makedirs(os.path.join(newDir, "Posters", "Core"), exist_ok=True)
     os.makedirs(os.path.join(newDir, "Posters", "Non-core"), exist_ok=True)
     os.makedirs(os.path.join(newDir, "Posters", "Associated"), exist_ok=True)
+    os.makedirs(cacheDir, exist_ok=True)
 
-    if verbose:
-        print("Copying files to formatted forlder structure...")
-
-    copyFormated(papers, posters, newDir, verbose)
-
-    if verbose:
-        print("Converting files to pdf...")
+    _log.info("Copying files to formatted forlder structure...")
 
-    batch2pdf(newDir, verbose)
+    paperFiles, posterFiles = copyFormated(papers, posters, newDir)
 
-    if verbose:
-        print("Inserting QR codes to posters...")
+    _log.info("Converting files to pdf and inserting QR codes to posters...")
 
     year = datetime.datetime.now().strftime("%Y")
     # Base link where file should point to
@@ -390,12 +701,17 @@ if __name__ == "__main__":
     # Location for placing the QR code on the poster
     QRLocation = [1400, 2415, 1540, 2555]
 
-    batchQRCode(os.path.join(newDir, "Posters"), baseLink, QRLocation, verbose)
+    # Posters follow the papers in the files to convert. Each poster pdf goes
+    # on to QR insertion while Office is still converting the other files
+    pdfFiles = batch2pdf(paperFiles + posterFiles, cacheDir=cacheDir,
+                         dstDir=newDir)
+    # Keyed by the index of the poster, which saveList looks titles up by
+    posterPDFs = ((i - len(paperFiles), pdf) for i, pdf in pdfFiles
+                  if i >= len(paperFiles))
+    titles = batchQRCode(posterPDFs, baseLink, QRLocation)
 
-    if verbose:
-        print(f"Creating submission files list in {newDir}...")
+    _log.info("Creating submission files list in %s...", newDir)
 
-    saveList(papers, posters, newDir)
+    saveList(papers, posters, newDir, titles)
 
-    if verbose:
-        print("Done")
\ No newline at end of file
+    _log.info("Done")
\ No newline at end of file
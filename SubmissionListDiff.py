@@ -9,64 +9,58 @@ import sys
 import csv
 import re
 
-def diff(A, B):
-    """Compare two list of files and find changes"""
-    # A is the reference, and B is supposedly the newer version
-    a = list(csv.DictReader(open(A, 'r'), skipinitialspace=True))
-    b = list(csv.DictReader(open(B, 'r'), skipinitialspace=True))
 
-    # Get list of base names
-    getName = re.compile(r"(.*)_R\d+")
-    namesA = [getName.match(f["File name"]).group(1) for f in a]
-    namesB = [getName.match(f["File name"]).group(1) for f in b]
+# Base name of a submission without the revision number
+_NAME_RE = re.compile(r"(.*)_R\d+")
+
 
-    # Get category and area
-    catA = [f["Category"] for f in a]
-    catB = [f["Category"] for f in b]
-    areaA = [f["Area"] for f in a]
-    areaB = [f["Area"] for f in b]
+def load(path):
+    """Read a list of files into {base name: (mtime, category, area)}"""
+    subs = {}
+    with open(path, 'r', newline='') as f:
+        for row in csv.DictReader(f, skipinitialspace=True):
+            n = _NAME_RE.match(row["File name"]).group(1)
+            subs[n] = (float(row["Last Modified"]), row["Category"],
+                       row["Area"])
 
-    # Get last modified time
-    mtimeA = [float(f["Last Modified"]) for f in a]
-    mtimeB = [float(f["Last Modified"]) for f in b]
+    return subs
+
+
+def diff(A, B):
+    """Compare two list of files and find changes"""
+    # A is the reference, and B is supposedly the newer version
+    subsA = load(A)
+    subsB = load(B)
 
     # Find new and modified submissions
     newSubs = []
     contentModifies = []
     categoryChanges = []
-    for i, n in enumerate(namesB):
-        if n not in namesA:
+    for n, (mtime, cat, area) in subsB.items():
+        old = subsA.get(n)
+        if old is None:
             newSubs.append(n)
-        else:
-            indxA = namesA.index(n)
-            if mtimeA[indxA] != mtimeB[i]:
-                contentModifies.append(n)
-            if catA[indxA] != catB[i] or areaA[indxA] != areaB[i]:
-                categoryChanges.append(n)
-
-    # Find deleted submissions
-    delSubs = []
-    for n in namesA:
-        if n not in namesB:
-            delSubs.append(n)
-
-    # Report changes
-    print(f"Comparing {os.path.basename(B)} against {os.path.basename(A)}\n")
-    print(f"Total new submissions: {len(newSubs)}")
-    for n in newSubs:
-        print(f"+ {n}")
+            continue
 
-    print(f"\nDeleted submissions: {len(delSubs)}")
-    for n in delSubs:
-        print(f"- {n}")
+        if old[0] != mtime:
+            contentModifies.append(n)
+        if old[1] != cat or old[2] != area:
+            categoryChanges.append(n)
 
-    print(f"\nContent modified: {len(contentModifies)}")
-    for n in contentModifies:
-        print(f"@ {n}")
+    # Find deleted submissions
+    delSubs = [n for n in subsA if n not in subsB]
 
-    print(f"\nCategory change: {len(categoryChanges)}")
-    for n in categoryChanges:
-        print(f"# {n}")
+    # Report changes, one write per section
+    sys.stdout.write(f"Comparing {os.path.basename(B)} against "
+                     f"{os.path.basename(A)}\n\n")
+    sys.stdout.write(f"Total new submissions: {len(newSubs)}\n" +
+                     "".join(f"+ {n}\n" for n in newSubs))
+    sys.stdout.write(f"\nDeleted submissions: {len(delSubs)}\n" +
+                     "".join(f"- {n}\n" for n in delSubs))
+    sys.stdout.write(f"\nContent modified: {len(contentModifies)}\n" +
+                     "".join(f"@ {n}\n" for n in contentModifies))
+    sys.stdout.write(f"\nCategory change: {len(categoryChanges)}\n" +
+                     "".join(f"# {n}\n" for n in categoryChanges))
 
 
 if __name__ == "__main__":
@@ -84,11 +78,9 @@ if __name__ == "__main__":
                          "SubmissionListDiff *dir*\n or\n"
                          "SubmissionListDiff *fileA* *fileB*")
 
-    csvFiles = []
-    for f in os.listdir(folder):
-        _, ext = os.path.splitext(f)
-        if ext.lower() == ".csv":
-            csvFiles.append(os.path.join(folder, f))
+    with os.scandir(folder) as it:
+        csvFiles = [e.path for e in it
+                    if e.is_file() and e.name.lower().endswith(".csv")]
 
     if len(csvFiles) != 2:
         raise ValueError(f"Expected 2 csv files, found {len(csvFiles)}")